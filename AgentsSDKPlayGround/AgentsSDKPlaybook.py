@@ -1,19 +1,15 @@
 import asyncio
+import re
 import uuid
-import os
-import logging
-from typing import Literal, Optional, List
-from pydantic import BaseModel
-from agents import Agent, Runner, trace, ModelSettings
+from enum import Enum
+from typing import Optional, List
+from pydantic import BaseModel, ConfigDict
+from agents import Agent, AgentOutputSchema, Runner, trace, ModelSettings
 
-# Import configuration
-from config import OPENAI_API_KEY
-
-# Set the OpenAI API key from config
-os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
-
-# Disable httpx INFO logs to hide OpenAI API calls
-logging.getLogger("httpx").setLevel(logging.WARNING)
+# Process-wide setup (API key, logging) runs from main()/create_agents, not at import
+from _bootstrap import bootstrap
+from _client import get_shared_client, start_warmup, finish_warmup, aclose_shared_client
+from _streaming import run_streamed
 
 """
 Simple handoffs/routing pattern using structured outputs. All messages go through the triage agent, 
@@ -21,20 +17,79 @@ which uses structured responses to determine routing decisions for single or mul
 """
 
 # Structured output models
+class Action(str, Enum):
+    """Routing actions the triage agent can decide on"""
+    HANDOFF_FR = "handoff_to_french"
+    HANDOFF_ES = "handoff_to_spanish"
+    HANDOFF_DE = "handoff_to_german"
+    COMPLETE = "complete"
+
 class TriageDecision(BaseModel):
     """Decision from triage agent about next action"""
-    action: Literal["handoff_to_french", "handoff_to_spanish", "handoff_to_german", "complete"]
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    action: Action
     message: str
     remaining_languages: List[str] = []
 
 class TranslationResponse(BaseModel):
     """Response from a specialist translation agent"""
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     translated_text: str
     source_language: str
     target_language: str
     message: str
 
+# Output schema built once and shared by every triage agent, instead of per run
+TRIAGE_OUTPUT_SCHEMA = AgentOutputSchema(TriageDecision)
+
+# Languages served by a specialist agent, in the order create_agents returns them
+SPECIALIST_LANGUAGES = ("French", "Spanish", "German")
+
+# Target languages are only planned from an explicit "to/into <lang>, <lang> and <lang>" list,
+# with quoted source text removed first so words inside it are not mistaken for targets
+_LANGUAGE_ALTERNATION = "|".join(language.lower() for language in SPECIALIST_LANGUAGES)
+_TARGET_LIST_RE = re.compile(
+    rf"\b(?:to|into)\s+((?:{_LANGUAGE_ALTERNATION})(?:\s*(?:,\s*and|,|and|&)\s*(?:{_LANGUAGE_ALTERNATION}))*)\b"
+)
+_LANGUAGE_RE = re.compile(_LANGUAGE_ALTERNATION)
+_QUOTED_TEXT_RE = re.compile(r"\"[^\"]*\"|(?<!\w)'[^']*'(?!\w)")
+
+# Shared instructions for every specialist, only the language name differs
+TRANSLATOR_INSTRUCTIONS = """You are a {language} language expert.
+                        - ALWAYS do TWO things in every response:
+                        1. Provide the {language} translation clearly
+                        2. Immediately call transfer_to_triage_agent tool to hand back control
+                        - Translate the given text to {language} accurately and naturally.
+                        CRITICAL: Always include both the translation AND the handoff tool call in the same response."""
+
+# Agent graphs already built by create_agents, keyed by their LLM config
+_agents_cache = {}
+
+# The only dict config keys create_agents reads, other keys are ignored and stay out of the cache key
+_LLM_CONFIG_FIELDS = ("model", "temperature", "max_tokens", "top_p", "frequency_penalty",
+                      "presence_penalty", "tool_choice", "parallel_tool_calls")
+
+
+def _config_cache_key(llm_config):
+    """Build a hashable cache key from a dict or ModelSettings LLM config"""
+    if not llm_config:
+        return frozenset()
+    if isinstance(llm_config, dict):
+        return tuple(repr(llm_config.get(field)) for field in _LLM_CONFIG_FIELDS)
+    # ModelSettings is an unhashable dataclass, its repr covers every field
+    return repr(llm_config)
+
+
 def create_agents(llm_config=None):
+    bootstrap()
+
+    # Reuse the agent graph (and its validated ModelSettings) if this config was already built
+    key = _config_cache_key(llm_config)
+    if key in _agents_cache:
+        return _agents_cache[key]
+
     # Convert dict config to ModelSettings if needed
     model_settings = None
     model_name = None
@@ -58,45 +113,18 @@ def create_agents(llm_config=None):
             # Assume it's already a ModelSettings object
             model_settings = llm_config
 
-    # Create specialist agents with optional LLM config
-    french_agent = Agent(
-        name="french_agent",
-        instructions="""You are a French language expert.
-                        - ALWAYS do TWO things in every response:
-                        1. Provide the French translation clearly
-                        2. Immediately call transfer_to_triage_agent tool to hand back control
-                        - Translate the given text to French accurately and naturally.
-                        CRITICAL: Always include both the translation AND the handoff tool call in the same response.""",
-        model=model_name,  # Pass model name
-        model_settings=model_settings or ModelSettings(),  # Pass ModelSettings
-        handoffs=[],  # Will be set after triage_agent is defined
-    )
-
-    spanish_agent = Agent(
-        name="spanish_agent",
-        instructions="""You are a Spanish language expert.
-                        - ALWAYS do TWO things in every response:
-                        1. Provide the Spanish translation clearly
-                        2. Immediately call transfer_to_triage_agent tool to hand back control
-                        - Translate the given text to Spanish accurately and naturally.
-                        CRITICAL: Always include both the translation AND the handoff tool call in the same response.""",
-        model=model_name,  # Pass model name
-        model_settings=model_settings or ModelSettings(),  # Pass ModelSettings
-        handoffs=[],  # Will be set after triage_agent is defined
-    )
-
-    german_agent = Agent(
-        name="german_agent",
-        instructions="""You are a German language expert.
-                        - ALWAYS do TWO things in every response:
-                        1. Provide the German translation clearly
-                        2. Immediately call transfer_to_triage_agent tool to hand back control
-                        - Translate the given text to German accurately and naturally.
-                        CRITICAL: Always include both the translation AND the handoff tool call in the same response.""",
-        model=model_name,  # Pass model name
-        model_settings=model_settings or ModelSettings(),  # Pass ModelSettings
-        handoffs=[],  # Will be set after triage_agent is defined
-    )
+    # Create specialist agents with optional LLM config, all sharing one instruction template
+    specialists = {
+        language: Agent(
+            name=f"{language.lower()}_agent",
+            instructions=TRANSLATOR_INSTRUCTIONS.format(language=language),
+            model=model_name,  # Pass model name
+            model_settings=model_settings or ModelSettings(),  # Pass ModelSettings
+            handoffs=[],  # Will be set after triage_agent is defined
+        )
+        for language in SPECIALIST_LANGUAGES
+    }
+    french_agent, spanish_agent, german_agent = specialists.values()
 
     # Triage agent handles all routing decisions
     triage_agent = Agent(
@@ -113,31 +141,74 @@ def create_agents(llm_config=None):
                     - ONLY ONE TOOL CAN BE CALLED IN CASE OF MULTIPLE remaining_languages
                     - Keep track of languages remaining to be translated in remaining_languages
                     - You can choose any language to start with, but must complete all requested languages
+                    - If the conversation already contains translations for all requested languages → action="complete"
 
                     Example response pattern:
                     - Structured output: {"action": "handoff_to_french", "message": "...", "remaining_languages": ["spanish"]}
                     - Tool call: transfer_to_french_agent()
                     """,
-        output_type=TriageDecision,
+        output_type=TRIAGE_OUTPUT_SCHEMA,
         model=model_name,  # Pass model name
         model_settings=model_settings or ModelSettings(),  # Pass ModelSettings
-        handoffs=[french_agent, spanish_agent, german_agent],
+        handoffs=list(specialists.values()),
     )
 
     # Set up bidirectional handoffs after all agents are defined
     # Specialist agents automatically hand back to triage after providing translation
-    french_agent.handoffs = [triage_agent]
-    spanish_agent.handoffs = [triage_agent]
-    german_agent.handoffs = [triage_agent]
+    for specialist in specialists.values():
+        specialist.handoffs = [triage_agent]
+
+    _agents_cache[key] = (triage_agent, french_agent, spanish_agent, german_agent)
+    return _agents_cache[key]
+
+# Default agents are created lazily on first access (PEP 562) instead of at import time
+_DEFAULT_AGENT_NAMES = ("triage_agent", "french_agent", "spanish_agent", "german_agent")
+
+
+def __getattr__(name):
+    if name in _DEFAULT_AGENT_NAMES:
+        return create_agents()[_DEFAULT_AGENT_NAMES.index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    return triage_agent, french_agent, spanish_agent, german_agent
 
-# Create default agents (can be overridden by calling create_agents with custom LLM config)
-triage_agent, french_agent, spanish_agent, german_agent = create_agents()
+def plan_target_languages(msg, language_agents):
+    """Planner step: pick the specialist agents for the explicitly requested target languages"""
+    text = _QUOTED_TEXT_RE.sub(" ", msg).lower()
+    targets = []
+    for target_list in _TARGET_LIST_RE.finditer(text):
+        for language in _LANGUAGE_RE.findall(target_list.group(1)):
+            if language not in targets:
+                targets.append(language)
+    return [language_agents[language] for language in targets]
+
+
+async def run_specialists_in_parallel(specialists, inputs):
+    """Translate into all target languages concurrently and merge the results into one input list"""
+    # Specialists run without handoffs so each returns its translation instead of bouncing back to triage
+    results = await asyncio.gather(
+        *(Runner.run(agent.clone(handoffs=[]), input=inputs) for agent in specialists)
+    )
+
+    merged_inputs = list(inputs)
+    for agent, result in zip(specialists, results):
+        print("Agent completed :: ", agent.name)
+        print(result.final_output)
+        print("\n")
+        # Each result was run on the shared inputs, keep only its new items
+        merged_inputs.extend(item.to_input_item() for item in result.new_items)
+    return merged_inputs
 
 
 async def main(llm_config=None):
+    bootstrap()
     triage_agent, french_agent, spanish_agent, german_agent = create_agents(llm_config)
+    language_agents = {"french": french_agent, "spanish": spanish_agent, "german": german_agent}
+    # Specialist for every handoff action, "complete" has no entry
+    handoff_map = {Action.HANDOFF_FR: french_agent, Action.HANDOFF_ES: spanish_agent, Action.HANDOFF_DE: german_agent}
+
+    # Share one pooled HTTP client across all agent runs and warm it up while the user types
+    get_shared_client()
+    warmup_task = start_warmup()
 
     # Create conversation ID for tracing
     conversation_id = str(uuid.uuid4().hex[:16])
@@ -150,8 +221,9 @@ async def main(llm_config=None):
     # Start with triage agent
     agent = triage_agent
     
-    # Get first message
-    msg = input("How can I help you today? ")
+    # Get first message (read in a worker thread so the event loop keeps running)
+    msg = await asyncio.to_thread(input, "How can I help you today? ")
+    await finish_warmup(warmup_task)
     
     # Main conversation loop
     while True:
@@ -160,31 +232,43 @@ async def main(llm_config=None):
         
         # Process the entire conversation under a single trace
         with trace("Multi-Language Conversation", group_id=conversation_id):
+            # Independent translations are fanned out concurrently, triage then only confirms completion
+            specialists = plan_target_languages(msg, language_agents)
+            if len(specialists) > 1:
+                print("Agents running in parallel :: ", ", ".join(a.name for a in specialists))
+                inputs = await run_specialists_in_parallel(specialists, inputs)
+
             # Continue processing until conversation is complete
+            turn = 0
             while True:
-                # Process current message through current agent
-                print("Agent running :: ", agent.name)
-                result = await Runner.run(agent, input=inputs)
+                turn += 1
+                # Process current message through current agent, streaming text as it arrives
+                result = await run_streamed(agent, inputs)
 
-                # Print the output directly
-                print(result.final_output)
+                # Text was already streamed, structured decisions are printed once parsed
+                if not isinstance(result.final_output, str):
+                    print(result.final_output)
                 print("\n")
                 
-                inputs = result.to_input_list()
+                # Append only this run's items instead of rebuilding the whole history
+                inputs.extend(item.to_input_item() for item in result.new_items)
                 agent = result.last_agent
 
-                # Check if we're back at triage agent and use structured output to determine next action
-                if agent == triage_agent:
+                # Check if we're back at triage agent (identity check, Agent.__eq__ compares every field)
+                # and use structured output to determine next action
+                if agent is triage_agent:
                     # Get the structured response from triage agent
                     try:
                         triage_response = result.final_output
                         if isinstance(triage_response, TriageDecision):
-                            print(f"Triage decision: {triage_response.action}, remaining: {triage_response.remaining_languages}")
-                            if triage_response.action == "complete":
+                            print(f"Triage decision: {triage_response.action.value}, remaining: {triage_response.remaining_languages}")
+                            next_agent = handoff_map.get(triage_response.action)
+                            if next_agent is None:
                                 print("✅ Translation workflow completed!")
                                 # Conversation is complete, break out of inner loop
                                 break
-                            # If not complete, the handoff will continue automatically
+                            # Triage decided on a handoff without calling the tool, route to the specialist directly
+                            agent = next_agent
                         else:
                             print(f"Unexpected triage response type: {type(triage_response)}")
                             # Fallback: break if we can't parse the structured output
@@ -195,7 +279,7 @@ async def main(llm_config=None):
 
                 # Safety check: prevent infinite loops by limiting iterations
                 # This shouldn't be needed with proper logic, but provides safety
-                if len(inputs) > 20:  # Arbitrary limit
+                if turn > 20:  # Arbitrary limit
                     print("⚠️  Too many iterations, breaking to prevent infinite loop")
                     break
                 
@@ -203,10 +287,11 @@ async def main(llm_config=None):
         
         # After conversation is complete, ask for new input
         print("\n" + "="*50)
-        user_msg = input("\nEnter a message (or 'quit' to exit): ")
+        user_msg = await asyncio.to_thread(input, "\nEnter a message (or 'quit' to exit): ")
         
         if user_msg.lower() in ['quit', 'exit', 'bye']:
             print("👋 Goodbye!")
+            await aclose_shared_client()
             break
             
         # Set up for next conversation - inputs are reset fresh for each conversation
@@ -214,6 +299,39 @@ async def main(llm_config=None):
         agent = triage_agent  # Always start with triage agent for new conversations
 
 
+async def run_batch(queries, concurrency=8, llm_config=None):
+    """Run independent queries through the triage agent concurrently, for scripted/eval workloads
+
+    Results are returned in query order; a query that raised gets its exception in its slot.
+    Tune concurrency to the account's OpenAI rate limits.
+    """
+    triage_agent, *_ = create_agents(llm_config)
+    get_shared_client()
+
+    queue = asyncio.Queue()
+    for item in enumerate(queries):
+        queue.put_nowait(item)
+    results = [None] * len(queries)
+
+    async def worker():
+        while True:
+            try:
+                idx, msg = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                results[idx] = await Runner.run(triage_agent, input=[{"content": msg, "role": "user"}])
+            except Exception as e:
+                results[idx] = e
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        # Release the pooled connections once the batch is done, as main() does on exit
+        await aclose_shared_client()
+    return results
+
+
 def create_custom_llm_config():
     # Example configurations you can tune:
     custom_config = {
@@ -236,4 +354,7 @@ if __name__ == "__main__":
     asyncio.run(main(custom_llm_config))
 
     # Example 3: Run with inline configuration
-    # asyncio.run(main({"model": "gpt-3.5-turbo", "temperature": 0.1, "max_tokens": 300}))
\ No newline at end of file
+    # asyncio.run(main({"model": "gpt-3.5-turbo", "temperature": 0.1, "max_tokens": 300}))
+
+    # Example 4: Run a batch of scripted queries concurrently
+    # asyncio.run(run_batch(open("prompts.txt").read().splitlines(), concurrency=8))
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Process-wide setup for the Agents SDK examples
+Called from main()/create_agents instead of at import time, so importing an example has no side effects
+"""
+
+import os
+import logging
+
+# Import configuration
+from config import OPENAI_API_KEY
+
+_done = False
+
+
+def bootstrap():
+    """Export the API key from config.py and quiet httpx logging, once per process"""
+    global _done
+    if _done:
+        return
+    # An OPENAI_API_KEY already set in the environment (e.g. in CI) wins over config.py
+    os.environ.setdefault('OPENAI_API_KEY', OPENAI_API_KEY)
+    # Disable httpx INFO logs to hide OpenAI API calls
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    _done = True
@@ -0,0 +1,60 @@
+"""
+Shared OpenAI client for the Agents SDK examples
+A single AsyncOpenAI instance on the aiohttp transport is reused by every agent run,
+so connections are kept alive instead of paying a TCP/TLS handshake per call
+"""
+
+import asyncio
+import atexit
+from contextlib import suppress
+
+import httpx
+from openai import AsyncOpenAI, DefaultAioHttpClient
+from agents import set_default_openai_client
+
+from _bootstrap import bootstrap
+
+# Large enough that concurrent agent runs never wait on the pool
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+
+_shared_client = None
+
+
+def get_shared_client():
+    """Create the process-wide AsyncOpenAI client on first use and register it with the Agents SDK"""
+    global _shared_client
+    if _shared_client is None:
+        # Built lazily so OPENAI_API_KEY from config.py is already in the environment
+        bootstrap()
+        _shared_client = AsyncOpenAI(http_client=DefaultAioHttpClient(limits=HTTP_LIMITS))
+        # Every Agent without an explicit model client now runs on this instance
+        set_default_openai_client(_shared_client)
+        atexit.register(_close_at_exit)
+    return _shared_client
+
+
+def start_warmup():
+    """Open the TCP/TLS connection to the API in the background with a cheap request"""
+    # models.list() returns an awaitable paginator rather than a coroutine
+    return asyncio.ensure_future(get_shared_client().models.list())
+
+
+async def finish_warmup(warmup_task):
+    """Wait for the warm-up request; failures are ignored since the real call will surface them"""
+    with suppress(Exception):
+        await warmup_task
+
+
+async def aclose_shared_client():
+    """Close the shared client from inside the event loop that used it"""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.close()
+        _shared_client = None
+
+
+def _close_at_exit():
+    # Fallback for scripts that exit without awaiting aclose_shared_client()
+    if _shared_client is not None:
+        with suppress(Exception):
+            asyncio.run(aclose_shared_client())
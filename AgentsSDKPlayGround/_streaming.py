@@ -0,0 +1,28 @@
+"""
+Streaming helper for the Agents SDK examples
+Prints model text as it is generated instead of waiting for the full final_output
+"""
+
+import sys
+
+from agents import Runner
+from openai.types.responses import ResponseTextDeltaEvent
+
+
+async def run_streamed(agent, input, **kwargs):
+    """Run an agent with streaming, echo plain-text output live and return the finished result"""
+    result = Runner.run_streamed(agent, input=input, **kwargs)
+    current_agent = agent
+
+    async for event in result.stream_events():
+        if event.type == "agent_updated_stream_event":
+            # Emitted for the starting agent and again after every handoff
+            current_agent = event.new_agent
+            print("Agent running :: ", current_agent.name)
+        elif event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            # Structured outputs stream as raw JSON, those are printed once parsed
+            if current_agent.output_type is None:
+                sys.stdout.write(event.data.delta)
+                sys.stdout.flush()
+
+    return result
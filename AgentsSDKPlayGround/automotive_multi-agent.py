@@ -4,21 +4,47 @@ Demonstrates how the Triage Agent works with LLM in a loop to handle complex mul
 Based on AgentV3.md design with OpenAI Agents SDK
 """
 
-import os
+import re
 import asyncio
-from agents import Agent, Runner, function_tool
-from pydantic import BaseModel
+from functools import lru_cache
+from types import MappingProxyType
+from agents import Agent, Runner, ToolCallOutputItem, function_tool
+from pydantic import BaseModel, ConfigDict
 from typing import List, Dict, Any, Optional
 import json
+import orjson
 
-# Import configuration
-from config import OPENAI_API_KEY
+# Process-wide setup (API key, logging) runs from main(), not at import
+from _bootstrap import bootstrap
+from _client import get_shared_client, start_warmup, finish_warmup, aclose_shared_client
+from _streaming import run_streamed
 
-# Set the OpenAI API key from config
-os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
+# Metadata shared by every mock MCP response
+_TS = "2025-01-15T10:30:00Z"
+_SVR_RO = "repair-orders-server-3003"
+_SVR_PARTS = "parts-server-3005"
+_SVR_PAY = "payment-server-3002"
+_RO_META = MappingProxyType({"timestamp": _TS, "mcp_server": _SVR_RO})
+_PARTS_META = MappingProxyType({"timestamp": _TS, "mcp_server": _SVR_PARTS})
+_PAYMENT_META = MappingProxyType({"timestamp": _TS, "mcp_server": _SVR_PAY})
+
+# Compiled once instead of on every create_payment_link call
+_EMAIL_RE = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
+
+# Entities classify_query pulls out of an "add part ... payment link" query
+_QUERY_RO_RE = re.compile(r'\b(RO_\w+)', re.IGNORECASE)
+_QUERY_PART_RE = re.compile(r'\b(PART_\w+)', re.IGNORECASE)
+_QUERY_EMAIL_RE = re.compile(r'[^\s@,;]+@[^\s@,;]+\.[A-Za-z]{2,}')
+_QUERY_AMOUNT_RE = re.compile(
+    r'payment link (?:of|for)\s*(?P<pre>\$|₹|USD|INR)?\s*(?P<amount>\d+(?:\.\d+)?)\s*(?P<post>\$|₹|USD|INR|dollars?|rupees?)?',
+    re.IGNORECASE
+)
+_CURRENCY_CODES = MappingProxyType({"$": "USD", "usd": "USD", "dollar": "USD", "dollars": "USD",
+                                    "₹": "INR", "inr": "INR", "rupee": "INR", "rupees": "INR"})
 
 # Data Models for Multi-Domain Operations
 class WorkflowStep(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
     step_id: str
     agent_type: str  # repair_orders, parts, payment
     action: str
@@ -27,6 +53,7 @@ class WorkflowStep(BaseModel):
     status: str = "pending"  # pending, in_progress, completed, failed
 
 class WorkflowPlan(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
     request_id: str
     original_query: str
     steps: List[WorkflowStep]
@@ -34,18 +61,19 @@ class WorkflowPlan(BaseModel):
     parallel_groups: List[List[str]] = []  # groups of steps that can run in parallel
 
 class WorkflowResult(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
     step_id: str
     success: bool
     result: Any
     error_message: Optional[str] = None
 
 # Mock MCP Tools (simulating the actual MCP servers with correct endpoints)
-@function_tool
-def get_repair_order_details(ro_number: str) -> Dict[str, Any]:
-    """Get details of a repair order - VALIDATION STEP"""
+@lru_cache(maxsize=128)
+def _get_repair_order_details_impl(ro_number: str) -> str:
+    """Build the memoized get_repair_order_details response, serialized to JSON once"""
     # Simulate MCP server response format
     if ro_number == "RO_001":
-        return {
+        return orjson.dumps({
             "success": True,
             "tool": "get_repair_order_details",
             "result": {
@@ -59,24 +87,28 @@ def get_repair_order_details(ro_number: str) -> Dict[str, Any]:
                 "canModify": True,
                 "createdDate": "2025-01-15"
             },
-            "timestamp": "2025-01-15T10:30:00Z",
-            "mcp_server": "repair-orders-server-3003"
-        }
+            **_RO_META
+        }).decode()
     else:
-        return {
+        return orjson.dumps({
             "success": False,
             "error": "Repair Order Not Found",
             "message": f"Repair order {ro_number} not found",
             "tool": "get_repair_order_details",
-            "mcp_server": "repair-orders-server-3003"
-        }
+            "mcp_server": _SVR_RO
+        }).decode()
 
 @function_tool
-def get_part_by_number(part_number: str) -> Dict[str, Any]:
-    """Get part details by part number - VALIDATION STEP"""
+def get_repair_order_details(ro_number: str) -> str:
+    """Get details of a repair order - VALIDATION STEP"""
+    return _get_repair_order_details_impl(ro_number)
+
+@lru_cache(maxsize=128)
+def _get_part_by_number_impl(part_number: str) -> str:
+    """Build the memoized get_part_by_number response, serialized to JSON once"""
     # Simulate MCP server response format
     if part_number == "PART_001":
-        return {
+        return orjson.dumps({
             "success": True,
             "tool": "get_part_by_number",
             "result": {
@@ -90,17 +122,16 @@ def get_part_by_number(part_number: str) -> Dict[str, Any]:
                 "availableQuantity": 25,
                 "compatibility": ["Honda Civic", "Honda Accord"]
             },
-            "timestamp": "2025-01-15T10:30:00Z",
-            "mcp_server": "parts-server-3005"
-        }
+            **_PARTS_META
+        }).decode()
     else:
-        return {
+        return orjson.dumps({
             "success": False,
             "error": "Part Not Found",
             "message": f"Part {part_number} not found in catalog",
             "tool": "get_part_by_number",
-            "mcp_server": "parts-server-3005"
-        }
+            "mcp_server": _SVR_PARTS
+        }).decode()
 
     """Check part availability - VALIDATION STEP"""
     # Simulate MCP server response format
@@ -189,9 +220,14 @@ def get_part_by_number(part_number: str) -> Dict[str, Any]:
         }
 
 @function_tool
-def add_part_to_repair_order(ro_number: str, part_number: str, quantity: int = 1) -> Dict[str, Any]:
-    """Add a part to an existing repair order - EXECUTION STEP"""
-    return {
+def get_part_by_number(part_number: str) -> str:
+    """Get part details by part number - VALIDATION STEP"""
+    return _get_part_by_number_impl(part_number)
+
+@lru_cache(maxsize=128)
+def _add_part_to_repair_order_impl(ro_number: str, part_number: str, quantity: int = 1) -> str:
+    """Build the memoized add_part_to_repair_order response, serialized to JSON once"""
+    return orjson.dumps({
         "success": True,
         "tool": "add_part_to_repair_order",
         "result": {
@@ -209,36 +245,38 @@ def add_part_to_repair_order(ro_number: str, part_number: str, quantity: int = 1
             },
             "inventoryReserved": True
         },
-        "timestamp": "2025-01-15T10:30:00Z",
         "message": f"Successfully added {quantity}x {part_number} to repair order {ro_number}",
-        "mcp_server": "repair-orders-server-3003"
-    }
+        **_RO_META
+    }).decode()
 
 @function_tool
-def create_payment_link(ro_number: str, amount: float, customer_email: str, currency: str = "INR") -> Dict[str, Any]:
+def add_part_to_repair_order(ro_number: str, part_number: str, quantity: int = 1) -> str:
+    """Add a part to an existing repair order - EXECUTION STEP"""
+    return _add_part_to_repair_order_impl(ro_number, part_number, quantity)
+
+@function_tool
+def create_payment_link(ro_number: str, amount: float, customer_email: str, currency: str = "INR") -> str:
     """Create a payment link for a repair order - EXECUTION STEP"""
     # Email validation
-    import re
-    email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
-    if not re.match(email_regex, customer_email):
-        return {
+    if not _EMAIL_RE.match(customer_email):
+        return orjson.dumps({
             "success": False,
             "error": "Invalid Email",
             "message": "Valid customer email is required",
             "tool": "create_payment_link"
-        }
+        }).decode()
 
     # Amount validation
     if amount <= 0 or amount > 999999999:
-        return {
+        return orjson.dumps({
             "success": False,
             "error": "Invalid Amount",
             "message": "Payment amount must be between 0 and 999999999",
             "tool": "create_payment_link"
-        }
+        }).decode()
 
     payment_link_id = f"PL_{ro_number}_{int(amount)}"
-    return {
+    return orjson.dumps({
         "success": True,
         "tool": "create_payment_link",
         "result": {
@@ -251,44 +289,58 @@ def create_payment_link(ro_number: str, amount: float, customer_email: str, curr
             "expiresAt": "2025-01-16T10:30:00Z",
             "status": "ACTIVE"
         },
-        "timestamp": "2025-01-15T10:30:00Z",
         "message": f"Payment link created for {currency} {amount} sent to {customer_email}",
-        "mcp_server": "payment-server-3002"
-    }
+        **_PAYMENT_META
+    }).decode()
 
-@function_tool
-def analyze_multi_domain_request(query: str) -> WorkflowPlan:
-    """Analyze a complex query and create a DEFENSIVE workflow plan with comprehensive validation"""
+def classify_query(query: str) -> Optional[WorkflowPlan]:
+    """Return the DEFENSIVE workflow plan for a recognized query, or None if it needs the LLM"""
     # This simulates the LLM's analysis of the request with defensive validation
-    if "add part" in query.lower() and "payment link" in query.lower():
+    query_lower = query.lower()
+    if "add part" in query_lower and "payment link" in query_lower:
+        # Every entity comes from the query itself, anything missing is left to the triage LLM
+        ro_match = _QUERY_RO_RE.search(query)
+        part_match = _QUERY_PART_RE.search(query)
+        email_match = _QUERY_EMAIL_RE.search(query)
+        amount_match = _QUERY_AMOUNT_RE.search(query)
+        if not (ro_match and part_match and email_match and amount_match):
+            return None
+
+        ro_number = ro_match.group(1).upper()
+        part_number = part_match.group(1).upper()
+        customer_email = email_match.group(0)
+        amount = float(amount_match.group("amount"))
+        currency_symbol = amount_match.group("pre") or amount_match.group("post")
+        # No currency in the query keeps create_payment_link's INR default
+        currency = _CURRENCY_CODES[currency_symbol.lower()] if currency_symbol else "INR"
+
         steps = [
             # VALIDATION PHASE - All entities must be validated first
             WorkflowStep(
                 step_id="validate_1",
                 agent_type="repair_orders",
                 action="validate_repair_order",
-                parameters={"ro_number": "RO_001"}
+                parameters={"ro_number": ro_number}
             ),
             WorkflowStep(
                 step_id="validate_2",
                 agent_type="parts",
                 action="validate_part_exists",
-                parameters={"part_number": "PART_001"},
-                dependencies=["validate_1"]
+                parameters={"part_number": part_number}
             ),
             # EXECUTION PHASE - Only after ALL validations pass
             WorkflowStep(
                 step_id="execute_1",
-                agent_type="parts",
+                agent_type="repair_orders",
                 action="add_part_to_order",
-                parameters={"ro_number": "RO_001", "part_number": "PART_001", "quantity": 1},
-                dependencies=["validate_5"]
+                parameters={"ro_number": ro_number, "part_number": part_number, "quantity": 1},
+                dependencies=["validate_1", "validate_2"]
             ),
             WorkflowStep(
                 step_id="execute_2",
                 agent_type="payment",
                 action="create_payment_link",
-                parameters={"ro_number": "RO_001", "amount": 100.0, "customer_email": "abc@gmail.com", "currency": "USD"},
+                parameters={"ro_number": ro_number, "amount": amount, "customer_email": customer_email, "currency": currency},
                 dependencies=["execute_1"]
             )
         ]
@@ -297,9 +349,20 @@ def analyze_multi_domain_request(query: str) -> WorkflowPlan:
             request_id="REQ_001_DEFENSIVE",
             original_query=query,
             steps=steps,
-            execution_order=["validate_1", "validate_2", "execute_1", "execute_2"]
+            execution_order=["validate_1", "validate_2", "execute_1", "execute_2"],
+            # Repair order and part validations hit different MCP servers and can run together
+            parallel_groups=[["validate_1", "validate_2"], ["execute_1"], ["execute_2"]]
         )
     
+    return None
+
+@function_tool
+def analyze_multi_domain_request(query: str) -> WorkflowPlan:
+    """Analyze a complex query and create a DEFENSIVE workflow plan with comprehensive validation"""
+    plan = classify_query(query)
+    if plan is not None:
+        return plan
+
     # Default single-step plan
     return WorkflowPlan(
         request_id="REQ_002",
@@ -362,27 +425,106 @@ payment_agent = Agent(
 # Update triage agent handoffs now that other agents are defined
 triage_agent.handoffs = [repair_orders_agent, parts_agent, payment_agent]
 
+# Specialists used to execute planned steps directly, without handing back to triage
+step_agents = {
+    "repair_orders": repair_orders_agent.clone(handoffs=[]),
+    "parts": parts_agent.clone(handoffs=[]),
+    "payment": payment_agent.clone(handoffs=[]),
+}
+
+def _tool_failure(result) -> Optional[str]:
+    """Return why a step's tool calls failed, or None if every tool reported success"""
+    tool_outputs = [item.output for item in result.new_items if isinstance(item, ToolCallOutputItem)]
+    if not tool_outputs:
+        return "No tool was called for this step"
+    for output in tool_outputs:
+        try:
+            payload = orjson.loads(output)
+        except (orjson.JSONDecodeError, TypeError):
+            continue
+        # The mock MCP tools report failures in-band as {"success": false, ...}
+        if isinstance(payload, dict) and payload.get("success") is False:
+            return payload.get("message") or payload.get("error") or f"{payload.get('tool', 'Tool')} failed"
+    return None
+
+async def _dispatch(step: WorkflowStep, max_turns: int) -> WorkflowResult:
+    """Execute a single workflow step on its specialist agent"""
+    try:
+        result = await Runner.run(
+            step_agents[step.agent_type],
+            f"Perform {step.action} with parameters: {json.dumps(step.parameters)}",
+            max_turns=max_turns
+        )
+    except Exception as e:
+        return WorkflowResult(step_id=step.step_id, success=False, result=None, error_message=str(e))
+
+    # A run that finishes normally can still carry a failed validation from its tool
+    failure = _tool_failure(result)
+    if failure is not None:
+        return WorkflowResult(step_id=step.step_id, success=False, result=result.final_output, error_message=failure)
+    return WorkflowResult(step_id=step.step_id, success=True, result=result.final_output)
+
+async def run_plan(plan: WorkflowPlan, max_turns: int = 5) -> Dict[str, WorkflowResult]:
+    """Run a workflow plan as a DAG: every step starts as soon as all of its dependencies succeeded"""
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def _step(step: WorkflowStep) -> WorkflowResult:
+        dependency_results = await asyncio.gather(*(tasks[d] for d in step.dependencies))
+        failed = [r.step_id for r in dependency_results if not r.success]
+        if failed:
+            # Defensive execution: never run a step whose prerequisites did not pass
+            step_result = WorkflowResult(step_id=step.step_id, success=False, result=None,
+                                         error_message=f"Skipped, failed dependencies: {', '.join(failed)}")
+        else:
+            print(f"⚡ Running {step.step_id} ({step.agent_type}: {step.action})")
+            step_result = await _dispatch(step, max_turns)
+        detail = step_result.result if step_result.success else step_result.error_message
+        print(f"{'✅' if step_result.success else '❌'} {step.step_id}: {detail}")
+        return step_result
+
+    # Steps at the same topological level run concurrently
+    tasks.update({step.step_id: asyncio.create_task(_step(step)) for step in plan.steps})
+    results = await asyncio.gather(*tasks.values())
+    return {r.step_id: r for r in results}
+
 async def execute_multi_domain_workflow(query: str, max_turns: int = 5) -> Dict[str, Any]:
     """Execute a multi-domain workflow with the triage agent"""
     print(f"🔄 Starting Multi-Domain Workflow Analysis")
     print(f"Query: {query}")
     print(f"Max Turns: {max_turns}")
     print("=" * 60)
-    
-    # Use the triage agent with max_turns to analyze and plan the workflow
-    result = await Runner.run(
+
+    # Recognized queries are planned in Python, skipping the triage LLM turn entirely
+    plan = classify_query(query)
+
+    if plan is not None:
+        print(f"📋 Using precomputed plan {plan.request_id}")
+        results = await run_plan(plan, max_turns=max_turns)
+        print("=" * 60)
+        return results
+
+    # Unrecognized query: use the triage agent with max_turns to analyze and plan the workflow
+    # Output is streamed as it is generated
+    result = await run_streamed(
         triage_agent, 
         f"Analyze this request and create a workflow plan: {query}",
         max_turns=max_turns
     )
     
-    print(f"🧠 Triage Agent Analysis Complete")
-    print(f"Agent Response: {result.final_output}")
+    print(f"\n🧠 Triage Agent Analysis Complete")
     print("=" * 60)
-    
+
+    # Same shape as the planned path, with the triage output as its single step
+    return {"triage": WorkflowResult(step_id="triage", success=True, result=result.final_output)}
  
 async def main():
     """Main function demonstrating multi-agent workflow with agent loop"""
+    bootstrap()
+
+    # All agents share one pooled OpenAI client, warmed up before the first agent run
+    get_shared_client()
+    warmup_task = start_warmup()
+
     print("🚗 Automotive Multi-Agent Workflow Demo")
     print("OpenAI Agents SDK with Agent Loop and Workflow Planning")
     print("=" * 60)
@@ -390,8 +532,12 @@ async def main():
     # Complex multi-domain query
     complex_query = "Add partNumber PART_001 to Repair order number RO_001, and send payment link of 100$ to abc@gmail.com"
     
+    await finish_warmup(warmup_task)
+
     # Execute with max_turns=5 to allow the agent loop to work
     await execute_multi_domain_workflow(complex_query, max_turns=10)
+
+    await aclose_shared_client()
     
 if __name__ == "__main__":
     asyncio.run(main())
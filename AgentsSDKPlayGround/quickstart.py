@@ -4,19 +4,16 @@ This implements the complete quickstart guide from https://openai.github.io/open
 with API key loaded from config.py instead of environment variables
 """
 
-import os
 import asyncio
-from agents import Agent, InputGuardrail, GuardrailFunctionOutput, Runner
+from agents import Agent, AgentOutputSchema, InputGuardrail, GuardrailFunctionOutput, Runner
 from agents.exceptions import InputGuardrailTripwireTriggered
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
-# Import configuration
-from config import OPENAI_API_KEY
-
-# Set the OpenAI API key from config
-os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
+# Process-wide setup (API key from config.py) runs from main(), not at import
+from _bootstrap import bootstrap
 
 class HomeworkOutput(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
     is_homework: bool
     reasoning: str
 
@@ -24,7 +21,8 @@ class HomeworkOutput(BaseModel):
 guardrail_agent = Agent(
     name="Guardrail check",
     instructions="Check if the user is asking about homework.",
-    output_type=HomeworkOutput,
+    # Precomputed schema, otherwise the SDK rebuilds it on every guardrail run
+    output_type=AgentOutputSchema(HomeworkOutput),
 )
 
 # Define specialist agents
@@ -61,6 +59,8 @@ triage_agent = Agent(
 
 async def main():
     """Main function to run the agent orchestration"""
+    bootstrap()
+
     print("OpenAI Agents SDK Quickstart Demo")
     print("=" * 40)
     
@@ -7,16 +7,33 @@ using the Kite Connect MCP server for live market data access.
 """
 
 import asyncio
+import hashlib
+import itertools
 import os
 import re
-import json
+import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, Optional, Tuple
-
-from agents import Agent, Runner
+from functools import lru_cache
+from importlib.metadata import version
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgspec
+import numpy as np
+import orjson
+from agents import Agent, AgentOutputSchema, Runner
+from aiolimiter import AsyncLimiter
+from openai.types.responses import ResponseTextDeltaEvent
 from agents.mcp import MCPServerSse
 from pydantic import BaseModel
 
+# MCP v2 transports run on httpx2 and reject plain httpx clients, v1 still uses httpx
+if int(version("mcp").split(".")[0]) >= 2:
+    import httpx2 as mcp_httpx
+else:
+    import httpx as mcp_httpx
+
 # Configuration
 KITE_MCP_SSE_URL = "https://mcp.kite.trade/sse"  # Hosted Kite MCP Server (SSE endpoint)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -24,6 +41,209 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is required")
 
+# MCP transport timeouts, the SDK defaults (5s) are too tight for large multi-symbol quote payloads
+MCP_HTTP_TIMEOUT_SECONDS = 30  # connect/POST of each tool call
+MCP_SSE_READ_TIMEOUT_SECONDS = 300  # idle time allowed on the long-lived SSE stream
+MCP_SESSION_TIMEOUT_SECONDS = 30  # wait for a tool call's response message
+
+# One keep-alive pool to mcp.kite.trade shared by every MCP client in the process
+MCP_HTTP_LIMITS = mcp_httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=300)
+
+# LLM response cache for repeated quote prompts
+QUOTE_CACHE_PATH = ".trading_agent.db"
+QUOTE_CACHE_TTL_SECONDS = 300  # identical prompts within this window share one response, older rows are purged
+QUOTE_PROMPT_VERSION = 4  # bump when the analysis prompt changes to invalidate old entries
+
+# Quotes are fetched straight from MCP every tick, the LLM only runs for the trading signal
+ANALYSIS_EVERY_N_TICKS = 10
+ANALYSIS_MOVE_THRESHOLD_PERCENT = 0.5  # price move since the last analysis that triggers a new one
+
+# Backoff between profile checks while waiting for the browser login
+AUTH_POLL_DELAYS_SECONDS = (0.25, 0.5, 1, 2, 4)
+AUTH_TIMEOUT_SECONDS = 120  # how long to wait for the browser login before giving up
+
+# Quote polling cadence while streaming
+QUOTE_POLL_INTERVAL_SECONDS = 30
+QUOTE_SESSION_GRACE_SECONDS = 5  # extra time after the deadline before the session is cancelled
+
+# Request rate limits, calls queue on these instead of being throttled with 429s
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))  # agent runs per minute
+KITE_MCP_RPS = 3  # Kite quote API allows 3 requests per second
+
+# Prompts are kept byte-identical across calls so the provider's prompt-prefix cache can be reused,
+# only the trailing QUERY/QUOTE lines vary
+_SYSTEM_PROMPT = """You are an expert stock trading analyst with real-time market data access.
+
+Your responsibilities:
+1. Analyze any stock symbol provided by the user
+2. Monitor stock quotes and analyze price movements
+3. Provide trading signals (BUY/SELL/HOLD) with confidence levels
+4. Track price trends and volume patterns
+5. Generate structured analysis with clear reasoning
+
+Trading Rules:
+- BUY signal: Strong upward momentum, high volume, positive sentiment
+- SELL signal: Downward trend, profit-taking opportunity, risk management
+- HOLD signal: Sideways movement, unclear trend, wait for better entry
+
+Analysis Requirements:
+- Current price analysis
+- Price change and percentage
+- Volume analysis
+- Clear trading signal with confidence (0.0-1.0)
+- Detailed reasoning for the signal
+
+Use the available Kite MCP tools for market data access.
+Always specify the correct exchange:symbol format (e.g., NSE:RELIANCE).
+"""
+_ANALYSIS_HEADER = (
+    "Analyze the real-time quote below and produce the trading signal for its instrument. "
+    "Do not call any tools, the data is already fetched."
+)
+
+# Ticks kept per symbol, enough for a 4-hour session at one quote every 30s
+PRICE_HISTORY_CAPACITY = 512
+SMA_WINDOW = 5
+
+# Display constants for the streaming loop
+_SIGNAL_EMOJI = {"BUY": "🟢", "SELL": "🔴", "HOLD": "🟡"}
+_TIME_FMT = "%H:%M:%S"
+
+# Signal fields picked out of the partial structured output while the analysis streams,
+# the trailing delimiter makes sure the confidence number is complete
+_STREAMED_SIGNAL_RE = re.compile(r'"signal"\s*:\s*"(BUY|SELL|HOLD)"')
+_STREAMED_CONFIDENCE_RE = re.compile(r'"confidence"\s*:\s*([0-9.]+)\s*[,}]')
+
+# Symbol parsing, compiled once at import
+_EXCHANGES = r"(?:NSE|BSE|NFO|MCX)"
+# Tried in priority order, the explicit "NSE:RELIANCE" form wins over the looser ones anywhere in the query
+_SYMBOL_PATTERNS = (
+    re.compile(rf"(?P<exchange>{_EXCHANGES}):(?P<symbol>[A-Z0-9&\-]+)"),  # "NSE:RELIANCE"
+    re.compile(rf"(?P<symbol>[A-Z0-9&\-]+)\s+(?:ON|AT|TRADED\s+AT)\s+(?P<exchange>{_EXCHANGES})"),  # "RELIANCE on NSE"
+    re.compile(rf"(?P<exchange>{_EXCHANGES})\s+(?P<symbol>[A-Z0-9&\-]+)"),  # "NSE RELIANCE"
+)
+_KNOWN_SYMBOLS = ('RELIANCE', 'TCS', 'INFY', 'HDFC', 'ICICI', 'SBI', 'ITC',
+                  'HDFCBANK', 'BHARTIARTL', 'KOTAKBANK', 'LT', 'ASIANPAINT',
+                  'MARUTI', 'TITAN', 'NESTLEIND', 'ULTRACEMCO', 'BAJFINANCE',
+                  'SENSEX', 'NIFTY')
+# Whole words only, so "LT" inside "RESULTS" is not a match; longest first for overlapping names
+_KNOWN_SYMBOL_RE = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, sorted(_KNOWN_SYMBOLS, key=len, reverse=True))) + r")\b"
+)
+
+
+class _SharedMCPTransport(mcp_httpx.AsyncHTTPTransport):
+    """Connection pool shared across MCP clients, closing a client leaves the pool open"""
+
+    # Each MCP session opens its AsyncClient with `async with` and closes it on exit, which reaches
+    # the transport through __aexit__ (not aclose), so every per-client path is a no-op here
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    async def aclose(self):
+        pass
+
+    async def aclose_shared(self):
+        """Close the pooled connections once no MCP client needs them"""
+        await super().aclose()
+
+
+_SHARED_MCP_TRANSPORT = _SharedMCPTransport(limits=MCP_HTTP_LIMITS)
+
+
+def _shared_mcp_http_client(headers=None, timeout=None, auth=None) -> mcp_httpx.AsyncClient:
+    """httpx_client_factory for MCPServerSse that builds clients on the shared transport"""
+    if timeout is None:
+        timeout = mcp_httpx.Timeout(MCP_HTTP_TIMEOUT_SECONDS, read=MCP_SSE_READ_TIMEOUT_SECONDS)
+    # Redirects are left off like the SDK's default factory, the MCP transports handle them
+    return mcp_httpx.AsyncClient(
+        headers=headers, timeout=timeout, auth=auth, follow_redirects=False, transport=_SHARED_MCP_TRANSPORT
+    )
+
+
+def _tool_failed(result) -> bool:
+    """Whether an MCP tool call result is an error, the flag is `is_error` on MCP v2 and `isError` on v1"""
+    return bool(getattr(result, "is_error", getattr(result, "isError", False)))
+
+
+def _tool_text(result) -> str:
+    """Join the text content of an MCP tool call result"""
+    return "".join(content.text for content in result.content if content.type == "text")
+
+
+class QuoteInfo(msgspec.Struct):
+    """Fields of one instrument in a Kite get_quotes response, other fields are skipped while decoding"""
+    last_price: float = 0
+    volume: int = 0
+    ohlc: Dict[str, float] = {}
+    net_change: float = 0
+    instrument_token: int = 0
+
+
+class QuoteResp(msgspec.Struct):
+    """Top-level Kite get_quotes response, instruments stay undecoded until one is looked up"""
+    status: str = ""
+    data: Dict[str, msgspec.Raw] = {}
+
+
+# Instruments are decoded one at a time, so a malformed one only drops that symbol;
+# strict=False lets integral floats fill int fields
+_QUOTE_DECODER = msgspec.json.Decoder(QuoteResp)
+_QUOTE_INFO_DECODER = msgspec.json.Decoder(QuoteInfo, strict=False)
+
+
+@lru_cache(maxsize=64)
+def _decode_quote_response(quote_data_string: str) -> Optional[QuoteResp]:
+    """Decode a get_quotes response once, shared by every symbol looked up in it"""
+    try:
+        resp = _QUOTE_DECODER.decode(quote_data_string)
+    except msgspec.DecodeError:
+        return None
+    if resp.status != "success":
+        return None
+    return resp
+
+
+@lru_cache(maxsize=256)
+def _parse_quote_response(quote_data_string: str, symbol: str, exchange: str = "NSE") -> Optional[Dict[str, Any]]:
+    """Filter and extract a symbol's quote in a single parse, memoized so identical ticks skip decoding
+
+    The returned dict is shared between cache hits and must not be mutated.
+    """
+    # Cheap case-insensitive reject before parsing a large payload
+    if not re.search(re.escape(symbol), quote_data_string, re.IGNORECASE):
+        return None
+
+    resp = _decode_quote_response(quote_data_string)
+    if resp is None:
+        return None
+
+    # Kite keys quotes by exact "EXCHANGE:SYMBOL", so a dict hit replaces scanning every key
+    instrument_key = f"{exchange.upper()}:{symbol.upper()}"
+    raw_quote = resp.data.get(instrument_key)
+    if raw_quote is None:
+        return None
+    try:
+        quote_info = _QUOTE_INFO_DECODER.decode(raw_quote)
+    except msgspec.DecodeError:
+        return None
+    return {
+        "symbol": instrument_key,
+        "last_price": quote_info.last_price,
+        "volume": quote_info.volume,
+        "ohlc": quote_info.ohlc,
+        "net_change": quote_info.net_change,
+        "instrument_token": quote_info.instrument_token
+    }
+
+
+def _parse_batch_quotes(quote_data_string: str, watchlist: Tuple[Tuple[str, str], ...]) -> List[Optional[Dict[str, Any]]]:
+    """Extract every watchlist symbol's quote from one batched get_quotes response"""
+    return [_parse_quote_response(quote_data_string, symbol, exchange) for symbol, exchange in watchlist]
+
 
 class StockQuoteAnalysis(BaseModel):
     """Structured output for stock analysis"""
@@ -39,44 +259,120 @@ class StockQuoteAnalysis(BaseModel):
     timestamp: str
 
 
+class PriceHistory:
+    """Fixed-size ring buffer of ticks for one symbol, stored as parallel NumPy arrays"""
+
+    def __init__(self, capacity: int = PRICE_HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.price = np.empty(capacity, dtype=np.float32)
+        self.volume = np.empty(capacity, dtype=np.int64)
+        self.ts = np.empty(capacity, dtype=np.int64)  # epoch seconds
+        self.n = 0  # ticks appended so far, including overwritten ones
+
+    def __len__(self) -> int:
+        return min(self.n, self.capacity)
+
+    def append(self, ts: int, price: float, volume: int):
+        """Store one tick, overwriting the oldest once the buffer is full"""
+        i = self.n % self.capacity
+        self.price[i] = price
+        self.volume[i] = volume
+        self.ts[i] = ts
+        self.n += 1
+
+    def sma(self, window: int = SMA_WINDOW) -> Optional[float]:
+        """Simple moving average over the last `window` prices"""
+        count = min(window, len(self))
+        if not count:
+            return None
+        end = self.n % self.capacity
+        start = end - count
+        if start >= 0:
+            recent = self.price[start:end]
+        else:
+            # Window wraps around the end of the buffer
+            recent = np.concatenate((self.price[start:], self.price[:end]))
+        return float(recent.mean(dtype=np.float64))
+
+
+class QuoteResponseCache:
+    """SQLite-backed cache of StockQuoteAnalysis outputs, keyed by instrument and prompt
+
+    Rows are stored as JSON and all DB work runs in a worker thread, off the event loop.
+    """
+
+    def __init__(self, path: str = QUOTE_CACHE_PATH, ttl_seconds: float = QUOTE_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        # Used from asyncio.to_thread workers, the lock serializes access to the one connection
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "key TEXT PRIMARY KEY, created_at REAL NOT NULL, analysis_json TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(instrument_key: str, prompt: str) -> str:
+        """Hash the prompt together with its instrument and the prompt version"""
+        raw = f"{QUOTE_PROMPT_VERSION}|{instrument_key}|{prompt}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[StockQuoteAnalysis]:
+        """Return the cached analysis for a key, or None if missing or expired"""
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, analysis: StockQuoteAnalysis):
+        """Store an analysis and purge expired entries"""
+        await asyncio.to_thread(self._set, key, analysis.model_dump_json())
+
+    def _get(self, key: str) -> Optional[StockQuoteAnalysis]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analysis_json FROM analyses WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return StockQuoteAnalysis.model_validate_json(row[0]) if row else None
+
+    def _set(self, key: str, analysis_json: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, created_at, analysis_json) VALUES (?, ?, ?)",
+                (key, now, analysis_json),
+            )
+            self._conn.execute("DELETE FROM analyses WHERE created_at <= ?", (now - self.ttl_seconds,))
+            self._conn.commit()
+
+
 class TradingAgent:
     """Generic trading agent for any stock symbol analysis"""
     
     def __init__(self):
         self.agent = None
         self.mcp_server = None
-        self.price_history = {}  # Store history per symbol
+        self.price_history = {}  # PriceHistory per instrument key
         self.current_symbol = None
         self.current_exchange = None
+        self.response_cache = QuoteResponseCache()
+        self.last_analysis_price = {}  # price at the last LLM analysis, per instrument key
+        self._llm_limiter = AsyncLimiter(OPENAI_RPM, 60)
+        self._mcp_limiter = AsyncLimiter(KITE_MCP_RPS, 1)
         
     def parse_symbol_from_query(self, query: str) -> Tuple[Optional[str], Optional[str]]:
         """Extract trading symbol and exchange from user query"""
         query_upper = query.upper()
 
-        # Pattern 1: "NSE:RELIANCE" format
-        match = re.search(r'(NSE|BSE|NFO|MCX):([A-Z0-9&\-]+)', query_upper)
-        if match:
-            return match.group(2), match.group(1)
-
-        # Pattern 2: "RELIANCE on NSE" format
-        match = re.search(r'([A-Z0-9&\-]+)\s+(?:ON|AT|TRADED\s+AT)\s+(NSE|BSE|NFO|MCX)', query_upper)
-        if match:
-            return match.group(1), match.group(2)
+        # "NSE:RELIANCE", then "RELIANCE on NSE", then "NSE RELIANCE"
+        for pattern in _SYMBOL_PATTERNS:
+            match = pattern.search(query_upper)
+            if match:
+                return match.group("symbol"), match.group("exchange")
 
-        # Pattern 3: "NSE RELIANCE" format
-        match = re.search(r'(NSE|BSE|NFO|MCX)\s+([A-Z0-9&\-]+)', query_upper)
+        # Known symbols, default to NSE
+        match = _KNOWN_SYMBOL_RE.search(query_upper)
         if match:
-            return match.group(2), match.group(1)
-
-        # Pattern 4: Known symbols, default to NSE
-        known_symbols = ['RELIANCE', 'TCS', 'INFY', 'HDFC', 'ICICI', 'SBI', 'ITC',
-                        'HDFCBANK', 'BHARTIARTL', 'KOTAKBANK', 'LT', 'ASIANPAINT',
-                        'MARUTI', 'TITAN', 'NESTLEIND', 'ULTRACEMCO', 'BAJFINANCE',
-                        'SENSEX', 'NIFTY']
-
-        for symbol in known_symbols:
-            if symbol in query_upper:
-                return symbol, "NSE"
+            return match.group(0), "NSE"
 
         return None, None
     
@@ -91,40 +387,29 @@ class TradingAgent:
         
         # Setup Kite MCP Server with SSE transport
         self.mcp_server = MCPServerSse(
-            url=KITE_MCP_SSE_URL,
-            name="kite-trading-server"
+            params={
+                "url": KITE_MCP_SSE_URL,
+                "timeout": MCP_HTTP_TIMEOUT_SECONDS,
+                "sse_read_timeout": MCP_SSE_READ_TIMEOUT_SECONDS,
+                "httpx_client_factory": _shared_mcp_http_client,
+            },
+            name="kite-trading-server",
+            # The Kite tool list doesn't change mid-session, so every run reuses the first listing
+            cache_tools_list=True,
+            client_session_timeout_seconds=MCP_SESSION_TIMEOUT_SECONDS
         )
+        # Connected up front since quotes are fetched directly through this session
+        await self.mcp_server.connect()
+        # Warms cache_tools_list so the first agent run doesn't pay for the listing
+        await self.mcp_server.list_tools()
         
         # Create trading agent with market analysis capabilities
         self.agent = Agent(
             name="generic_trading_agent",
-            instructions="""
-            You are an expert stock trading analyst with real-time market data access.
-            
-            Your responsibilities:
-            1. Analyze any stock symbol provided by the user
-            2. Monitor stock quotes and analyze price movements
-            3. Provide trading signals (BUY/SELL/HOLD) with confidence levels
-            4. Track price trends and volume patterns
-            5. Generate structured analysis with clear reasoning
-            
-            Trading Rules:
-            - BUY signal: Strong upward momentum, high volume, positive sentiment
-            - SELL signal: Downward trend, profit-taking opportunity, risk management
-            - HOLD signal: Sideways movement, unclear trend, wait for better entry
-            
-            Analysis Requirements:
-            - Current price analysis
-            - Price change and percentage
-            - Volume analysis
-            - Clear trading signal with confidence (0.0-1.0)
-            - Detailed reasoning for the signal
-            
-            Use the available Kite MCP tools for market data access.
-            Always specify the correct exchange:symbol format (e.g., NSE:RELIANCE).
-            """,
+            instructions=_SYSTEM_PROMPT,
             model="gpt-4",
-            output_type=StockQuoteAnalysis,
+            # Built once, a bare model class would have its JSON schema rebuilt on every run
+            output_type=AgentOutputSchema(StockQuoteAnalysis),
             mcp_servers=[self.mcp_server]
         )
         
@@ -149,52 +434,56 @@ class TradingAgent:
         return True
     
     async def _get_user_profile(self):
-        """Get user profile and handle authentication flow"""
-        max_attempts = 3
-        
-        for attempt in range(max_attempts):
+        """Get user profile and handle authentication flow with direct MCP calls, without the LLM"""
+        try:
+            profile = await self._fetch_profile()
+            if profile:
+                self._display_welcome_message(profile)
+                return True
+
+            print("🔑 Login required")
+            login_result = await self._call_tool("login", {})
+            print("🌐 Please complete authentication in your browser")
+            print(f"🔗 {_tool_text(login_result)}")
+            print("⏳ Waiting for authentication completion...")
+        except Exception as e:
+            print(f"❌ Error starting authentication: {e}")
+            return False
+
+        # Poll the cheap profile call with backoff, holding at the cap until the login window closes
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AUTH_TIMEOUT_SECONDS
+        delays = itertools.chain(AUTH_POLL_DELAYS_SECONDS, itertools.repeat(AUTH_POLL_DELAYS_SECONDS[-1]))
+        for delay in delays:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(delay, remaining))
             try:
-                # Try to get profile
-                result = await Runner.run(
-                    self.agent,
-                    input="Get my user profile information using the get_profile tool.",
-                    context=None
-                )
-                
-                if result and hasattr(result, 'final_output'):
-                    output = str(result.final_output)
-                    
-                    # Check if we need to login
-                    if any(keyword in output.lower() for keyword in ['login', 'authenticate', 'session']):
-                        print(f"🔑 Login required (attempt {attempt + 1}/{max_attempts})")
-                        
-                        # Call login tool
-                        login_result = await Runner.run(
-                            self.agent,
-                            input="Call the login tool to authenticate with Kite.",
-                            context=None
-                        )
-                        
-                        if login_result and hasattr(login_result, 'final_output'):
-                            login_output = str(login_result.final_output)
-                            if 'login' in login_output.lower() and 'kite' in login_output.lower():
-                                print("🌐 Please complete authentication in your browser")
-                                print("⏳ Waiting for authentication completion...")
-                                
-                                # Wait a moment for user to complete auth
-                                await asyncio.sleep(5)
-                                continue
-                    else:
-                        # Successfully got profile
-                        self._display_welcome_message(output)
-                        return True
-                        
+                profile = await self._fetch_profile()
             except Exception as e:
-                print(f"⚠️ Error during authentication attempt {attempt + 1}: {e}")
-                
-        print("❌ Authentication failed after all attempts")
+                print(f"⚠️ Error checking authentication status: {e}")
+                continue
+            if profile:
+                self._display_welcome_message(profile)
+                return True
+
+        print(f"❌ Authentication not completed within {AUTH_TIMEOUT_SECONDS}s")
         return False
-    
+
+    async def _call_tool(self, name: str, arguments: Dict[str, Any]):
+        """Call a Kite MCP tool directly, paced to Kite's per-second rate limit"""
+        async with self._mcp_limiter:
+            return await self.mcp_server.call_tool(name, arguments)
+
+    async def _fetch_profile(self) -> Optional[str]:
+        """Call the Kite get_profile tool directly, returning the profile text or None if not logged in"""
+        result = await self._call_tool("get_profile", {})
+        output = _tool_text(result)
+        if _tool_failed(result) or any(keyword in output.lower() for keyword in ['login', 'authenticate', 'session']):
+            return None
+        return output
+
     def _display_welcome_message(self, profile_data: str):
         """Display welcome message with profile information"""
         print("\n" + "="*60)
@@ -208,53 +497,74 @@ class TradingAgent:
         print("📋 Supported exchanges: NSE, BSE, NFO, MCX")
         print("="*60)
     
-    async def get_stock_quote(self, symbol: str, exchange: str = "NSE") -> Dict[str, Any]:
-        """Get current stock quote using MCP tools"""
+    async def get_stock_quote(self, symbol: str, exchange: str = "NSE") -> Optional[str]:
+        """Get the raw quote JSON by calling the Kite get_quotes MCP tool directly, without the LLM"""
+        return await self.get_batch_quotes([self.format_instrument_key(symbol, exchange)])
+
+    async def get_batch_quotes(self, instruments: List[str]) -> Optional[str]:
+        """Get the raw quote JSON for several EXCHANGE:SYMBOL instruments in a single get_quotes call"""
         try:
-            instrument_key = self.format_instrument_key(symbol, exchange)
-            result = await Runner.run(
-                self.agent,
-                input=f"Get the current real-time quote for {symbol} stock on {exchange} exchange. Use the get_quotes tool with symbol {instrument_key}.",
-                context=None
-            )
-            return result
+            result = await self._call_tool("get_quotes", {"instruments": instruments})
+            if _tool_failed(result):
+                print(f"❌ get_quotes failed for {', '.join(instruments)}")
+                return None
+            return _tool_text(result)
         except Exception as e:
-            print(f"❌ Error getting {symbol} quote: {e}")
+            print(f"❌ Error getting {', '.join(instruments)} quotes: {e}")
             return None
-    
-    def filter_symbol_data(self, quote_data_string: str, symbol: str) -> bool:
-        """Check if response contains data for the specified symbol"""
-        try:
-            data = json.loads(quote_data_string)
-            if data.get("status") != "success":
-                return False
-
-            quote_data = data.get("data", {})
-            return any(symbol.upper() in key.upper() for key in quote_data.keys())
 
-        except (json.JSONDecodeError, AttributeError):
-            return symbol.upper() in quote_data_string.upper()
-
-    def extract_quote_data(self, quote_data_string: str, symbol: str) -> Dict[str, Any]:
-        """Extract quote data from JSON response for the specified symbol"""
+    async def analyze_quote(self, symbol: str, exchange: str, quote_data: Dict[str, Any]) -> Optional[StockQuoteAnalysis]:
+        """Ask the agent for a trading signal on already-fetched quote data"""
         try:
-            data = json.loads(quote_data_string)
-            quote_data = data.get("data", {})
-
-            for instrument_key, quote_info in quote_data.items():
-                if symbol.upper() in instrument_key.upper():
-                    return {
-                        "symbol": instrument_key,
-                        "last_price": quote_info.get("last_price", 0),
-                        "volume": quote_info.get("volume", 0),
-                        "ohlc": quote_info.get("ohlc", {}),
-                        "net_change": quote_info.get("net_change", 0),
-                        "instrument_token": quote_info.get("instrument_token", 0)
-                    }
+            instrument_key = self.format_instrument_key(symbol, exchange)
+            # Sorted keys keep the serialized quote stable for both the prompt cache and the response cache
+            quote_json = orjson.dumps(quote_data, option=orjson.OPT_SORT_KEYS).decode()
+            prompt = f"{_ANALYSIS_HEADER}\n---\nQUERY: {instrument_key}\nQUOTE: {quote_json}"
+
+            # Identical quote data (common in quiet markets) reuses the previous analysis
+            cache_key = self.response_cache.make_key(instrument_key, prompt)
+            cached_output = await self.response_cache.get(cache_key)
+            if cached_output is not None:
+                return cached_output
+
+            async with self._llm_limiter:
+                result = Runner.run_streamed(
+                    self.agent,
+                    input=prompt,
+                    context=None
+                )
+                # Show the signal as soon as it is decodable, the stream still runs to completion
+                # since the full StockQuoteAnalysis is needed for the cache and the caller
+                streamed_output = ""
+                early_signal_shown = False
+                async for event in result.stream_events():
+                    if early_signal_shown or event.type != "raw_response_event":
+                        continue
+                    if not isinstance(event.data, ResponseTextDeltaEvent):
+                        continue
+                    streamed_output += event.data.delta
+                    signal_match = _STREAMED_SIGNAL_RE.search(streamed_output)
+                    confidence_match = _STREAMED_CONFIDENCE_RE.search(streamed_output)
+                    if signal_match and confidence_match:
+                        signal = signal_match.group(1)
+                        print(f"⚡ {_SIGNAL_EMOJI[signal]} Early signal for {symbol}: {signal} "
+                              f"(Confidence: {float(confidence_match.group(1)):.2f})")
+                        early_signal_shown = True
+            if isinstance(result.final_output, StockQuoteAnalysis):
+                await self.response_cache.set(cache_key, result.final_output)
+            return result.final_output
+        except Exception as e:
+            print(f"❌ Error analyzing {symbol} quote: {e}")
             return None
 
-        except (json.JSONDecodeError, AttributeError):
-            return None
+    def should_analyze(self, instrument_key: str, quote_count: int, last_price: float) -> bool:
+        """Run the LLM on the first tick, every N ticks, or after a significant price move"""
+        previous_price = self.last_analysis_price.get(instrument_key)
+        if previous_price is None or quote_count % ANALYSIS_EVERY_N_TICKS == 0:
+            return True
+        if not previous_price:
+            return False
+        return abs(last_price - previous_price) / previous_price * 100 >= ANALYSIS_MOVE_THRESHOLD_PERCENT
 
     async def analyze_stock_from_query(self, user_query: str) -> Dict[str, Any]:
         """Analyze stock based on user query"""
@@ -280,78 +590,146 @@ class TradingAgent:
             "timestamp": datetime.now().isoformat()
         }
 
+    def _record_quote(self, symbol: str, exchange: str, quote_data: Dict[str, Any], quote_count: int):
+        """Store a tick in the instrument's price history and print its key metrics"""
+        current_time = time.strftime(_TIME_FMT)
+        instrument_key = self.format_instrument_key(symbol, exchange)
+        print(f"📥 {instrument_key} Quote #{quote_count} received at {current_time}")
+
+        # Store in price history, per exchange so NSE and BSE ticks never mix
+        if instrument_key not in self.price_history:
+            self.price_history[instrument_key] = PriceHistory()
+        history = self.price_history[instrument_key]
+        history.append(int(time.time()), quote_data.get('last_price', 0), quote_data.get('volume', 0))
+
+        # Display key metrics
+        print(f"💰 Price: ₹{quote_data.get('last_price', 'N/A')}")
+        print(f"📊 Volume: {quote_data.get('volume', 'N/A'):,}")
+        print(f"📈 SMA({SMA_WINDOW}): ₹{history.sma():.2f}")
+
+    async def _report_signal(self, symbol: str, exchange: str, quote_data: Dict[str, Any], quote_count: int):
+        """Print a trading signal for the tick, only calling the LLM when a fresh signal is worth it"""
+        last_price = quote_data.get('last_price', 0)
+        instrument_key = self.format_instrument_key(symbol, exchange)
+        if not self.should_analyze(instrument_key, quote_count, last_price):
+            return
+        analysis = await self.analyze_quote(symbol, exchange, quote_data)
+        if isinstance(analysis, StockQuoteAnalysis):
+            self.last_analysis_price[instrument_key] = last_price
+            signal_emoji = _SIGNAL_EMOJI.get(analysis.signal, "⚪")
+            print(f"{signal_emoji} {symbol} Signal: {analysis.signal} (Confidence: {analysis.confidence:.2f})")
+
+    async def _poll_on_cadence(self, poll, duration_minutes: int, label: str):
+        """Await poll() every QUOTE_POLL_INTERVAL_SECONDS until the session deadline"""
+        loop = asyncio.get_running_loop()
+        duration_seconds = duration_minutes * 60
+        deadline = loop.time() + duration_seconds
+
+        async def _session():
+            # Ticks are scheduled on the monotonic loop clock, so fetch time doesn't push the cadence back
+            next_tick = loop.time()
+            while loop.time() < deadline:
+                try:
+                    await poll()
+                except Exception as e:
+                    print(f"❌ Error in streaming: {e}")
+
+                next_tick += QUOTE_POLL_INTERVAL_SECONDS
+                # After a slow tick, skip the ticks already missed instead of firing them back to back
+                next_tick = max(next_tick, loop.time())
+                await asyncio.sleep(max(0, min(next_tick, deadline) - loop.time()))
+
+        try:
+            # Hard stop even if a quote fetch or analysis hangs past the deadline
+            await asyncio.wait_for(_session(), timeout=duration_seconds + QUOTE_SESSION_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"⏱️ {label} streaming cancelled at the session deadline")
+
     async def stream_stock_quotes(self, symbol: str, exchange: str = "NSE", duration_minutes: int = 30):
         """Stream real-time quotes for specified stock"""
         print(f"📡 Starting {symbol} quote streaming on {exchange} for {duration_minutes} minutes...")
-
-        end_time = datetime.now().timestamp() + (duration_minutes * 60)
         quote_count = 0
 
-        while datetime.now().timestamp() < end_time:
-            try:
-                quote_result = await self.get_stock_quote(symbol, exchange)
-
-                if quote_result and hasattr(quote_result, 'final_output'):
-                    output = str(quote_result.final_output)
-
-                    if self.filter_symbol_data(output, symbol):
-                        quote_count += 1
-                        current_time = datetime.now().strftime("%H:%M:%S")
-                        print(f"📥 {symbol} Quote #{quote_count} received at {current_time}")
-
-                        quote_data = self.extract_quote_data(output, symbol)
-                        if quote_data:
-                            # Store in price history
-                            if symbol not in self.price_history:
-                                self.price_history[symbol] = []
-                            self.price_history[symbol].append({"timestamp": current_time, "data": quote_data})
-
-                            # Display key metrics
-                            print(f"💰 Price: ₹{quote_data.get('last_price', 'N/A')}")
-                            print(f"📊 Volume: {quote_data.get('volume', 'N/A'):,}")
-
-                            # Show analysis if available
-                            if hasattr(quote_result, 'final_output') and isinstance(quote_result.final_output, dict):
-                                analysis = quote_result.final_output
-                                if 'signal' in analysis:
-                                    signal_emoji = {"BUY": "🟢", "SELL": "🔴", "HOLD": "🟡"}.get(analysis['signal'], "⚪")
-                                    print(f"{signal_emoji} Signal: {analysis['signal']} (Confidence: {analysis.get('confidence', 0):.2f})")
-
-                        print("-" * 50)
-                    else:
-                        print(f"⚠️ No {symbol} data in response")
-                else:
-                    print(f"❌ Failed to get {symbol} quote")
-
-                await asyncio.sleep(30)
+        async def _poll_one():
+            nonlocal quote_count
+            output = await self.get_stock_quote(symbol, exchange)
+            if not output:
+                print(f"❌ Failed to get {symbol} quote")
+                return
+
+            # One cached parse both filters the response and extracts the quote,
+            # in a worker thread so a large payload doesn't stall the MCP SSE reads
+            quote_data = await asyncio.to_thread(_parse_quote_response, output, symbol, exchange)
+            if not quote_data:
+                print(f"⚠️ No {symbol} data in response")
+                return
+
+            quote_count += 1
+            self._record_quote(symbol, exchange, quote_data, quote_count)
+            await self._report_signal(symbol, exchange, quote_data, quote_count)
+            print("-" * 50)
+
+        await self._poll_on_cadence(_poll_one, duration_minutes, symbol)
+        print(f"✅ Streaming session completed. Total quotes received: {quote_count}")
 
-            except Exception as e:
-                print(f"❌ Error in streaming: {e}")
-                await asyncio.sleep(30)
+    async def _poll_batch(self, watchlist: List[Tuple[str, str]], quote_counts: Dict[str, int]):
+        """Fetch every watchlist quote in one get_quotes call and fan the response out per symbol"""
+        instruments = [self.format_instrument_key(symbol, exchange) for symbol, exchange in watchlist]
+        output = await self.get_batch_quotes(instruments)
+        if not output:
+            print("❌ Failed to get watchlist quotes")
+            return
 
-        print(f"✅ Streaming session completed. Total quotes received: {quote_count}")
+        # The response is decoded once, each symbol is then a dict lookup
+        quotes = await asyncio.to_thread(_parse_batch_quotes, output, tuple(watchlist))
 
-    async def run_trading_session(self, user_query: str = None):
-        """Run a complete trading session"""
-        await self.initialize()
+        signals = []
+        for (symbol, exchange), instrument_key, quote_data in zip(watchlist, instruments, quotes):
+            if not quote_data:
+                print(f"⚠️ No {symbol} data in response")
+                continue
+            quote_counts[instrument_key] += 1
+            self._record_quote(symbol, exchange, quote_data, quote_counts[instrument_key])
+            signals.append(self._report_signal(symbol, exchange, quote_data, quote_counts[instrument_key]))
 
-        if not user_query:
-            print("\n❓ No query provided. Please specify a stock to analyze.")
-            print("Example: 'Do live analysis of RELIANCE stock traded at NSE'")
-            return
+        # Analyses run concurrently so one slow LLM call doesn't hold up the other symbols
+        await asyncio.gather(*signals)
+        print("-" * 50)
 
-        print(f"\n🔍 Processing query: '{user_query}'")
+    async def stream_watchlist(self, watchlist: List[Tuple[str, str]], duration_minutes: int = 30):
+        """Stream quotes for several (symbol, exchange) pairs with one batched get_quotes call per tick"""
+        instruments = [self.format_instrument_key(symbol, exchange) for symbol, exchange in watchlist]
+        print(f"📡 Streaming watchlist: {', '.join(instruments)} for {duration_minutes} minutes...")
+        quote_counts = dict.fromkeys(instruments, 0)
 
-        analysis_result = await self.analyze_stock_from_query(user_query)
-        if "error" in analysis_result:
-            print(f"❌ {analysis_result['error']}")
-            return
+        await self._poll_on_cadence(lambda: self._poll_batch(watchlist, quote_counts), duration_minutes, "Watchlist")
+        print(f"✅ Streaming session completed. Total quotes received: {sum(quote_counts.values())}")
 
-        symbol = analysis_result["symbol"]
-        exchange = analysis_result["exchange"]
+    async def run_trading_session(self, user_query: str = None):
+        """Run a complete trading session"""
+        await self.initialize()
 
-        print(f"\n🔄 Starting {symbol} quote streaming on {exchange}...")
-        await self.stream_stock_quotes(symbol, exchange, duration_minutes=30)
+        try:
+            if not user_query:
+                print("\n❓ No query provided. Please specify a stock to analyze.")
+                print("Example: 'Do live analysis of RELIANCE stock traded at NSE'")
+                return
+
+            print(f"\n🔍 Processing query: '{user_query}'")
+
+            analysis_result = await self.analyze_stock_from_query(user_query)
+            if "error" in analysis_result:
+                print(f"❌ {analysis_result['error']}")
+                return
+
+            symbol = analysis_result["symbol"]
+            exchange = analysis_result["exchange"]
+
+            print(f"\n🔄 Starting {symbol} quote streaming on {exchange}...")
+            await self.stream_stock_quotes(symbol, exchange, duration_minutes=30)
+        finally:
+            await self.mcp_server.cleanup()
+            await _SHARED_MCP_TRANSPORT.aclose_shared()
 
 
 async def main():